@@ -6,10 +6,26 @@ Naples Trip Research - Using Direct API Calls
 import os
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder/decoder
+    orjson = None
 
 load_dotenv()
 
+# Shared session so repeated calls reuse pooled TLS connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504], allowed_methods=None)
+))
+
 def search_google_serper(query, endpoint="search"):
     """Direct call to Serper API"""
     serper_key = os.getenv("SERPER_API_KEY")
@@ -18,11 +34,11 @@ def search_google_serper(query, endpoint="search"):
         'X-API-KEY': serper_key,
         'Content-Type': 'application/json'
     }
-    data = json.dumps({"q": query})
+    data = orjson.dumps({"q": query}) if orjson else json.dumps({"q": query})
     
     try:
-        response = requests.post(url, headers=headers, data=data, timeout=10)
-        return response.json()
+        response = SESSION.post(url, headers=headers, data=data, timeout=10)
+        return orjson.loads(response.content) if orjson else response.json()
     except Exception as e:
         return {"error": str(e)}
 
@@ -44,7 +60,7 @@ def optimize_query_openai(query):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=15)
+        response = SESSION.post(url, headers=headers, json=data, timeout=15)
         result = response.json()
         return result['choices'][0]['message']['content'].strip()
     except Exception as e:
@@ -64,15 +80,23 @@ def main():
         return
     
     query = "Naples Italy family trip March teenagers best attractions restaurants hotels teen activities"
+    places_query = "Naples Italy hotels restaurants attractions for families"
     
-    print("🔍 Step 1: Optimizing search query...")
-    optimized = optimize_query_openai(query)
-    print(f"✨ Optimized: {optimized}\n")
+    # The places search doesn't depend on the optimized query, so run it
+    # alongside the OpenAI call; only the web search has to wait.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        places_future = executor.submit(search_google_serper, places_query, "places")
+        
+        print("🔍 Step 1: Optimizing search query...")
+        optimized = optimize_query_openai(query)
+        print(f"✨ Optimized: {optimized}\n")
+        
+        web_results = search_google_serper(optimized, "search")
+        places_results = places_future.result()
     
     print("=" * 80)
     print("📰 WEB SEARCH RESULTS - Travel Guides & Tips")
     print("=" * 80)
-    web_results = search_google_serper(optimized, "search")
     
     if 'organic' in web_results:
         for i, result in enumerate(web_results['organic'][:8], 1):
@@ -85,7 +109,6 @@ def main():
     print("\n\n" + "=" * 80)
     print("📍 PLACES SEARCH - Hotels, Restaurants & Attractions")
     print("=" * 80)
-    places_results = search_google_serper("Naples Italy hotels restaurants attractions for families", "places")
     
     if 'places' in places_results:
         for i, place in enumerate(places_results['places'][:10], 1):
@@ -17,14 +17,99 @@ Features:
 from fastmcp import FastMCP   
 from dotenv import load_dotenv
 import os
-import requests
+import re
+import asyncio
+import time
+import functools
+import threading
 import json  
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from collections import ChainMap
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Optional, Dict, List, Mapping, Tuple
+
+if TYPE_CHECKING:
+    import requests
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib parser is a drop-in fallback
+    orjson = None
+
+
+def _loads(payload: bytes):
+    """Decode a JSON response body, preferring orjson when it is installed"""
+    return orjson.loads(payload) if orjson else json.loads(payload)
+
+
+def singleflight(ttl: float, maxsize: int = 256):
+    """
+    Cache a function's results for `ttl` seconds and coalesce concurrent calls.
+    
+    Callers with identical arguments share one execution: while a call is on the
+    wire, later callers wait on its Future instead of issuing their own request.
+    Exceptions are propagated to every waiter and never cached.
+    """
+    def decorator(func):
+        cache: Dict[Tuple, Tuple[float, object]] = {}
+        inflight: Dict[Tuple, Future] = {}
+        lock = threading.Lock()
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            with lock:
+                hit = cache.get(key)
+                if hit and time.monotonic() < hit[0]:
+                    return hit[1]
+                pending = inflight.get(key)
+                if pending is None:
+                    future = inflight[key] = Future()
+            
+            if pending is not None:
+                return pending.result()
+            
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                with lock:
+                    del inflight[key]
+                future.set_exception(e)
+                raise
+            
+            with lock:
+                now = time.monotonic()
+                if len(cache) >= maxsize:
+                    for stale_key in [k for k, (expires, _) in cache.items() if expires <= now]:
+                        del cache[stale_key]
+                    if len(cache) >= maxsize:
+                        del cache[min(cache, key=lambda k: cache[k][0])]
+                cache[key] = (now + ttl, result)
+                del inflight[key]
+            future.set_result(result)
+            return result
+        
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
 
 # Load environment variables
 load_dotenv()
 
+# Flight offers are cached briefly: long enough to absorb repeated agent
+# queries, short enough that prices and availability stay fresh
+FLIGHT_CACHE_TTL_SECONDS = 60
+FLIGHT_CACHE_MAX_ENTRIES = 256
+
+# Airport reference data is effectively static
+AIRPORT_CACHE_TTL_SECONDS = 24 * 60 * 60
+AIRPORT_CACHE_MAX_ENTRIES = 512
+
+# (connect, read) timeout for Amadeus calls, in seconds. Flight offer searches can take
+# a while, but a stalled request must not hang every coalesced caller waiting on it
+AMADEUS_TIMEOUT = (5, 30)
+
 # Initialize FastMCP server
 mcp = FastMCP("flights_booking_mcp")
 
@@ -36,21 +121,76 @@ mcp = FastMCP("flights_booking_mcp")
 class AmadeusAPI:
     """Handle Amadeus API authentication and requests"""
     
-    def __init__(self):
-        self.api_key = os.getenv("AMADEUS_API_KEY")
-        self.api_secret = os.getenv("AMADEUS_API_SECRET")
+    def __init__(self, credentials: Optional[Mapping[str, str]] = None):
+        # Credentials are read once; explicit values (e.g. from tests) take precedence over the environment
+        source = ChainMap(dict(credentials or {}), os.environ)
+        self.api_key = source.get("AMADEUS_API_KEY")
+        self.api_secret = source.get("AMADEUS_API_SECRET")
         self.base_url = "https://test.api.amadeus.com"  # Use production URL for live bookings
-        self.access_token = None
-        self.token_expires_at = None
+        # (token, expires_at) in one attribute: the lock-free reader gets both with a
+        # single load, so it can never pair an old token with a new expiry
+        self._token: Optional[Tuple[str, datetime]] = None
+        self._token_lock = threading.Lock()
+        self.session = self._create_session()
+    
+    @property
+    def access_token(self) -> Optional[str]:
+        token = self._token
+        return token[0] if token else None
+    
+    @property
+    def token_expires_at(self) -> Optional[datetime]:
+        token = self._token
+        return token[1] if token else None
+    
+    @property
+    def has_credentials(self) -> bool:
+        """True when both the API key and secret are configured"""
+        return bool(self.api_key and self.api_secret)
+    
+    @staticmethod
+    def _create_session() -> "requests.Session":
+        """Create a pooled HTTP session so TLS connections are reused across calls"""
+        # Imported here so merely importing this module (e.g. to list tools) stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=None  # The OAuth POST is safe to retry as well
+        )
+        session = requests.Session()
+        # requests already negotiates gzip/deflate; ask explicitly for JSON only
+        session.headers.update({"Accept": "application/json"})
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retries))
+        return session
     
     def get_access_token(self) -> str:
         """Get or refresh Amadeus API access token"""
-        # Check if we have a valid token
-        if self.access_token and self.token_expires_at:
-            if datetime.now() < self.token_expires_at:
-                return self.access_token
+        # Fast path: valid token, no locking
+        token = self._valid_token()
+        if token:
+            return token
         
-        # Get new token
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            token = self._valid_token()
+            if token:
+                return token
+            return self._refresh_access_token()
+    
+    def _valid_token(self) -> Optional[str]:
+        """Return the cached token if it has not expired"""
+        token = self._token
+        if token and datetime.now() < token[1]:
+            return token[0]
+        return None
+    
+    def _refresh_access_token(self) -> str:
+        """Request a new OAuth token (caller must hold _token_lock)"""
         url = f"{self.base_url}/v1/security/oauth2/token"
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         data = {
@@ -60,33 +200,47 @@ class AmadeusAPI:
         }
         
         try:
-            response = requests.post(url, headers=headers, data=data)
+            response = self.session.post(url, headers=headers, data=data, timeout=AMADEUS_TIMEOUT)
             response.raise_for_status()
-            result = response.json()
+            result = _loads(response.content)
             
-            self.access_token = result["access_token"]
             # Token typically expires in 1800 seconds (30 minutes)
             expires_in = result.get("expires_in", 1800)
-            self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 60)
+            token = result["access_token"]
+            self._token = (token, datetime.now() + timedelta(seconds=expires_in - 60))
             
-            return self.access_token
+            return token
         except Exception as e:
             raise Exception(f"Failed to authenticate with Amadeus API: {str(e)}")
     
     def search_flights(self, origin: str, destination: str, departure_date: str, 
                       return_date: Optional[str] = None, adults: int = 1,
-                      travel_class: str = "ECONOMY", max_results: int = 10) -> Dict:
+                      travel_class: str = "ECONOMY", max_results: int = 10,
+                      non_stop: bool = False, included_airlines: Optional[str] = None) -> Dict:
         """Search for flights using Amadeus Flight Offers Search API"""
+        # Normalize before the cached call so equivalent searches share one entry
+        return self._fetch_flight_offers(
+            origin.upper(), destination.upper(), departure_date, return_date, adults,
+            travel_class.upper(), max_results, non_stop,
+            included_airlines.upper() if included_airlines else None
+        )
+    
+    @singleflight(ttl=FLIGHT_CACHE_TTL_SECONDS, maxsize=FLIGHT_CACHE_MAX_ENTRIES)
+    def _fetch_flight_offers(self, origin: str, destination: str, departure_date: str,
+                             return_date: Optional[str], adults: int,
+                             travel_class: str, max_results: int,
+                             non_stop: bool = False, included_airlines: Optional[str] = None) -> Dict:
+        """Call the Amadeus Flight Offers Search endpoint (cached and coalesced; expects search_flights' normalized arguments)"""
         token = self.get_access_token()
         url = f"{self.base_url}/v2/shopping/flight-offers"
         
         headers = {"Authorization": f"Bearer {token}"}
         params = {
-            "originLocationCode": origin.upper(),
-            "destinationLocationCode": destination.upper(),
+            "originLocationCode": origin,
+            "destinationLocationCode": destination,
             "departureDate": departure_date,
             "adults": adults,
-            "travelClass": travel_class.upper(),
+            "travelClass": travel_class,
             "max": max_results,
             "currencyCode": "USD"
         }
@@ -94,15 +248,27 @@ class AmadeusAPI:
         if return_date:
             params["returnDate"] = return_date
         
+        # Filtering server-side keeps the (often 100KB+) offer payload small
+        if non_stop:
+            params["nonStop"] = "true"
+        if included_airlines:
+            params["includedAirlineCodes"] = included_airlines
+        
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.session.get(url, headers=headers, params=params, timeout=AMADEUS_TIMEOUT)
             response.raise_for_status()
-            return response.json()
+            return _loads(response.content)
         except Exception as e:
             raise Exception(f"Flight search error: {str(e)}")
     
     def get_airport_info(self, keyword: str) -> Dict:
         """Search for airports by city or airport code"""
+        # Airport reference data is static, so equivalent keywords share one cached lookup
+        return self._fetch_airport_info(" ".join(keyword.split()).upper())
+    
+    @singleflight(ttl=AIRPORT_CACHE_TTL_SECONDS, maxsize=AIRPORT_CACHE_MAX_ENTRIES)
+    def _fetch_airport_info(self, keyword: str) -> Dict:
+        """Call the Amadeus locations endpoint (cached and coalesced; failures are not cached)"""
         token = self.get_access_token()
         url = f"{self.base_url}/v1/reference-data/locations"
         
@@ -114,21 +280,66 @@ class AmadeusAPI:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.session.get(url, headers=headers, params=params, timeout=AMADEUS_TIMEOUT)
             response.raise_for_status()
-            return response.json()
+            return _loads(response.content)
         except Exception as e:
             raise Exception(f"Airport search error: {str(e)}")
 
 
-# Initialize Amadeus API client
-amadeus = AmadeusAPI()
+@functools.lru_cache(maxsize=None)
+def _client() -> AmadeusAPI:
+    """Shared Amadeus client, created on first use rather than at import"""
+    return AmadeusAPI()
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run a blocking Amadeus call on the default executor so the event loop stays free"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def __getattr__(name: str):
+    # Keep `from servers.flights_booking_mcp import amadeus` working without
+    # constructing the client at import time
+    if name == "amadeus":
+        return _client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+# Travel classes accepted by the Flight Offers Search API
+_VALID_TRAVEL_CLASSES = frozenset({"ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST"})
+
+# Strict YYYY-MM-DD shape; calendar validity is checked separately in _is_valid_date
+_DATE_RE = re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2})")
+
+# Fixed banner and separator lines, built once instead of per call / per offer
+_FLIGHT_RESULTS_HEADER = "✈️  FLIGHT SEARCH RESULTS\n" + "=" * 80
+_FLIGHT_RESULTS_FOOTER = "\n" + "=" * 80
+_OPTION_SEPARATOR = "-" * 40
+_AIRPORT_RESULTS_HEADER = "🛫 AIRPORT SEARCH RESULTS\n" + "=" * 60
+_AIRPORT_RESULTS_FOOTER = "\n" + "=" * 60
+
+# One template per flight segment, bound once instead of three f-strings per segment
+_SEGMENT_FMT = "  {carrier}{number}: {origin} → {destination}\n  Depart: {departs}\n  Arrive: {arrives}".format
+
+
+def _is_valid_date(value: str) -> bool:
+    """Check a YYYY-MM-DD date without the format parsing overhead of strptime"""
+    match = _DATE_RE.fullmatch(value)
+    if not match:
+        return False
+    try:
+        date(int(match[1]), int(match[2]), int(match[3]))
+    except ValueError:
+        return False
+    return True
+
+
 def format_flight_results(data: Dict) -> str:
     """Format flight search results in a readable way"""
     if "errors" in data:
@@ -137,19 +348,18 @@ def format_flight_results(data: Dict) -> str:
                          for err in errors]
         return f"❌ Error searching flights:\n" + "\n".join(error_messages)
     
-    if "data" not in data or len(data["data"]) == 0:
+    offers = data.get("data")
+    if not offers:
         return "No flights found for your search criteria. Try different dates or airports."
     
-    results = []
-    results.append("✈️  FLIGHT SEARCH RESULTS")
-    results.append("=" * 80)
+    results = [_FLIGHT_RESULTS_HEADER]
     
-    for idx, offer in enumerate(data["data"][:10], 1):
+    for idx, offer in enumerate(offers[:10], 1):
         price = offer["price"]["total"]
         currency = offer["price"]["currency"]
         
         results.append(f"\n🎫 Option {idx}: {currency} {price}")
-        results.append("-" * 40)
+        results.append(_OPTION_SEPARATOR)
         
         for segment_idx, itinerary in enumerate(offer["itineraries"], 1):
             if segment_idx == 1:
@@ -162,20 +372,23 @@ def format_flight_results(data: Dict) -> str:
             for seg in itinerary["segments"]:
                 departure = seg["departure"]
                 arrival = seg["arrival"]
-                carrier = seg["carrierCode"]
-                flight_num = seg["number"]
-                
-                dep_time = departure["at"].replace("T", " ")
-                arr_time = arrival["at"].replace("T", " ")
+                dep_at = departure["at"]
+                arr_at = arrival["at"]
                 
-                results.append(f"  {carrier}{flight_num}: {departure['iataCode']} → {arrival['iataCode']}")
-                results.append(f"  Depart: {dep_time}")
-                results.append(f"  Arrive: {arr_time}")
+                # Amadeus timestamps are ISO "YYYY-MM-DDTHH:MM:SS"; swap the "T" by slicing
+                results.append(_SEGMENT_FMT(
+                    carrier=seg["carrierCode"],
+                    number=seg["number"],
+                    origin=departure["iataCode"],
+                    destination=arrival["iataCode"],
+                    departs=f"{dep_at[:10]} {dep_at[11:]}",
+                    arrives=f"{arr_at[:10]} {arr_at[11:]}"
+                ))
         
         results.append(f"Duration: {duration}")
     
-    results.append("\n" + "=" * 80)
-    results.append(f"Total results: {len(data['data'])} flights found")
+    results.append(_FLIGHT_RESULTS_FOOTER)
+    results.append(f"Total results: {len(offers)} flights found")
     
     return "\n".join(results)
 
@@ -188,9 +401,7 @@ def format_airport_results(data: Dict) -> str:
     if "data" not in data or len(data["data"]) == 0:
         return "No airports found. Try a different search term."
     
-    results = []
-    results.append("🛫 AIRPORT SEARCH RESULTS")
-    results.append("=" * 60)
+    results = [_AIRPORT_RESULTS_HEADER]
     
     for airport in data["data"]:
         name = airport.get("name", "Unknown")
@@ -201,7 +412,7 @@ def format_airport_results(data: Dict) -> str:
         results.append(f"\n📍 {name} ({iata})")
         results.append(f"   Location: {city}, {country}")
     
-    results.append("\n" + "=" * 60)
+    results.append(_AIRPORT_RESULTS_FOOTER)
     
     return "\n".join(results)
 
@@ -211,9 +422,10 @@ def format_airport_results(data: Dict) -> str:
 # ============================================================================
 
 @mcp.tool()
-def search_flights(origin: str, destination: str, departure_date: str,
+async def search_flights(origin: str, destination: str, departure_date: str,
                   return_date: str = None, adults: int = 1,
-                  travel_class: str = "ECONOMY") -> str:
+                  travel_class: str = "ECONOMY", non_stop: bool = False,
+                  airlines: str = None) -> str:
     """
     Search for flights using Amadeus API.
     
@@ -224,6 +436,8 @@ def search_flights(origin: str, destination: str, departure_date: str,
         return_date: Return date in YYYY-MM-DD format (optional, for round-trip)
         adults: Number of adult passengers (default: 1)
         travel_class: Travel class - ECONOMY, PREMIUM_ECONOMY, BUSINESS, FIRST (default: ECONOMY)
+        non_stop: Only return direct flights (default: False)
+        airlines: Comma-separated airline codes to restrict results to (optional, e.g., "AZ,DL")
     
     Returns:
         Formatted flight search results with prices, times, and airlines
@@ -236,19 +450,19 @@ def search_flights(origin: str, destination: str, departure_date: str,
         if not origin or not destination:
             return "❌ Error: Origin and destination airport codes are required"
         
-        if len(origin) != 3 or len(destination) != 3:
+        if not (len(origin) == 3 and origin.isalpha() and len(destination) == 3 and destination.isalpha()):
             return "❌ Error: Airport codes must be 3 letters (IATA codes). Use find_airports tool to search."
         
+        # Reject bad input here rather than after a full Amadeus round trip
+        if travel_class.upper() not in _VALID_TRAVEL_CLASSES:
+            return "❌ Error: Travel class must be one of ECONOMY, PREMIUM_ECONOMY, BUSINESS, FIRST"
+        
         # Validate date format
-        try:
-            datetime.strptime(departure_date, "%Y-%m-%d")
-            if return_date:
-                datetime.strptime(return_date, "%Y-%m-%d")
-        except ValueError:
+        if not _is_valid_date(departure_date) or (return_date and not _is_valid_date(return_date)):
             return "❌ Error: Dates must be in YYYY-MM-DD format"
         
         # Check API credentials
-        if not os.getenv("AMADEUS_API_KEY") or not os.getenv("AMADEUS_API_SECRET"):
+        if not _client().has_credentials:
             return """❌ Error: Amadeus API credentials not found.
             
 Please set up your Amadeus API credentials:
@@ -260,13 +474,16 @@ Please set up your Amadeus API credentials:
 """
         
         # Search flights
-        results = amadeus.search_flights(
+        results = await _run_blocking(
+            _client().search_flights,
             origin=origin,
             destination=destination,
             departure_date=departure_date,
             return_date=return_date,
             adults=adults,
-            travel_class=travel_class
+            travel_class=travel_class,
+            non_stop=non_stop,
+            included_airlines=airlines
         )
         
         return format_flight_results(results)
@@ -276,7 +493,7 @@ Please set up your Amadeus API credentials:
 
 
 @mcp.tool()
-def find_airports(search_term: str) -> str:
+async def find_airports(search_term: str) -> str:
     """
     Find airport codes by city name or airport name.
     
@@ -291,13 +508,13 @@ def find_airports(search_term: str) -> str:
         find_airports("New York")
     """
     try:
-        if not os.getenv("AMADEUS_API_KEY") or not os.getenv("AMADEUS_API_SECRET"):
+        if not _client().has_credentials:
             return """❌ Error: Amadeus API credentials not found.
 
 Please set up your Amadeus API credentials in your .env file.
 Visit https://developers.amadeus.com/ to get your credentials."""
         
-        results = amadeus.get_airport_info(search_term)
+        results = await _run_blocking(_client().get_airport_info, search_term)
         return format_airport_results(results)
         
     except Exception as e:
@@ -322,9 +539,10 @@ def flight_booking_help() -> str:
    - Find airport codes by city or airport name
    - Example: find_airports("Naples")
    
-2. search_flights(origin, destination, departure_date, return_date, adults, travel_class)
+2. search_flights(origin, destination, departure_date, return_date, adults, travel_class, non_stop, airlines)
    - Search for available flights with pricing
    - Example: search_flights("JFK", "NAP", "2025-03-15", "2025-03-22", 2)
+   - Direct flights only: search_flights("JFK", "NAP", "2025-03-15", non_stop=True)
 
 ⚙️  SETUP REQUIRED:
 
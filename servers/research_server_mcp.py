@@ -1,19 +1,37 @@
 
 
-from langchain_community.utilities import GoogleSerperAPIWrapper
-from langchain_hyperbrowser import HyperbrowserBrowserUseTool
 from langchain_openai import ChatOpenAI
-from fastmcp import FastMCP   
+from langchain_core.exceptions import OutputParserException
+from fastmcp import Context, FastMCP
 from dotenv import load_dotenv
+import io
+import numpy as np
 import os
+import re
+import string
+import time
+import functools
+import hashlib
+import asyncio
+import atexit
+import contextvars
+import logging
+import uuid
+import threading
+import openai
 import requests
 import json  
-from crewai import Agent, Task, Crew
-from datetime import datetime
-from fastmcp.settings import ExperimentalSettings
-from mcp import StdioServerParameters
-from crewai_tools import MCPServerAdapter
-from crewai.tools import tool
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder/decoder is a drop-in fallback
+    orjson = None
 
 
 
@@ -22,97 +40,929 @@ from crewai.tools import tool
 # Load environment variables first
 load_dotenv()
 
+# API keys are resolved once; the environment doesn't change while the server runs
+OPENAI_API_KEY = (os.getenv("OPENAI_API_KEY") or "").strip()
+SERPER_API_KEY = (os.getenv("SERPER_API_KEY") or "").strip()
+
+# Keys every tool needs; HYPERBROWSER_API_KEY stays optional since browser search degrades gracefully
+_REQUIRED_KEYS = ("OPENAI_API_KEY", "SERPER_API_KEY")
+
+
+def _validate_env():
+    """Fail once at startup, listing every missing key, instead of re-checking on each call"""
+    missing = [name for name in _REQUIRED_KEYS if not globals()[name]]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+
+_validate_env()
+
+logger = logging.getLogger(__name__)
+
+# Correlates the log lines of one research_agent call, including those from worker threads
+_REQUEST_ID = contextvars.ContextVar("request_id", default="-")
+
 # Initialize FastMCP server
 mcp = FastMCP("research_mcp")
 
-# Initialize LLM with API key from environment
+# Initialize LLM with API key from environment. Query rewriting and tool routing are
+# small tasks, so a small fast model is the default. Output is capped (batched optimization
+# gets its own, larger budget) and slow calls are cut off rather than waited on
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 llm = ChatOpenAI(
+    model=OPENAI_MODEL,
     temperature=0,
-    api_key=os.getenv("OPENAI_API_KEY")
+    max_tokens=400,
+    timeout=15,
+    api_key=OPENAI_API_KEY
+)
+
+# (connect, read) timeouts so a stalled Serper call can't hang a research request
+SERPER_TIMEOUT = (3, 15)
+
+# Cap on simultaneous Serper requests. Fan-out beyond this only trips Serper's
+# rate limit; 429s that do happen are retried by _HTTP, honouring Retry-After
+SERPER_MAX_CONCURRENCY = 8
+_SERPER_SLOTS = threading.BoundedSemaphore(SERPER_MAX_CONCURRENCY)
+
+# Shared HTTP session for Serper: keeps TLS connections alive between calls and
+# retries transient failures (Serper searches are idempotent, so POST is safe to retry).
+# All traffic goes to one host, so a single pool holding one keep-alive connection
+# per concurrency slot means warm calls never pay for a new TLS handshake
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=SERPER_MAX_CONCURRENCY,
+    pool_block=True,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST"]
+    )
+))
+atexit.register(_HTTP.close)
+
+# Serper request headers never change while the server runs, and _HTTP only talks
+# to Serper, so they live on the session instead of being merged into every call
+_SERPER_HEADERS = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
+_HTTP.headers.update(_SERPER_HEADERS)
+
+# Worker threads for fanning out independent (blocking) searches, shared by every
+# request so load can't spawn unbounded threads. Serper calls are further capped
+# by _SERPER_SLOTS; the extra workers leave room for slow browser runs
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="research")
+
+# Hyperbrowser has no timeout of its own. Runs happen on their own small pool so a
+# caller can stop waiting after BROWSER_TIMEOUT (the run itself can't be interrupted)
+BROWSER_TIMEOUT = 60
+_BROWSER_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="browser")
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class SemanticCache:
+    """
+    TTL/LRU cache looked up by meaning rather than exact text.
+    
+    `embed` maps a string to a vector. A lookup hits when a live entry's
+    embedding has cosine similarity >= `threshold` with the query's. Unit
+    vectors live in one preallocated (maxsize x dim) matrix, so a lookup is a
+    single matrix-vector product with no per-call copying; at this cache's
+    size that beats an ANN index. Expiry uses wall-clock time so entries can
+    be saved and reloaded across restarts; values must be JSON-serializable.
+    """
+    
+    def __init__(self, embed, maxsize: int, ttl: float, threshold: float = 0.95):
+        self.embed = embed
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._slots = OrderedDict()  # key -> matrix row, least recently used first
+        self._vectors = None  # allocated on first insert, once the dimension is known
+        self._expires = np.full(maxsize, -np.inf)
+        self._values = [None] * maxsize
+        self._free = list(range(maxsize - 1, -1, -1))
+        self._lock = threading.Lock()
+    
+    def _unit_vector(self, text: str):
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def get(self, text: str):
+        """Return the value stored for the most similar live query, or None"""
+        value, similarity = self.nearest(text)
+        return value if similarity >= self.threshold else None
+    
+    def nearest(self, text: str):
+        """(value, cosine similarity) of the most similar live query, or (None, -inf) when empty"""
+        query_vector = self._unit_vector(text)
+        with self._lock:
+            if not self._slots:
+                return None, -np.inf
+            similarities = self._vectors @ query_vector
+            similarities[self._expires <= time.time()] = -np.inf  # expired and empty rows
+            best = int(np.argmax(similarities))
+            if similarities[best] == -np.inf:
+                return None, -np.inf
+            if similarities[best] >= self.threshold:  # only full hits count as use for LRU
+                self._slots.move_to_end(self._values[best][0])
+            return self._values[best][1], float(similarities[best])
+    
+    def set(self, text: str, value) -> None:
+        vector = self._unit_vector(text)
+        with self._lock:
+            self._store(_normalize_query(text), time.time() + self.ttl, vector, value)
+    
+    def _store(self, key: str, expires_at: float, vector, value) -> None:
+        """Write one entry into its row, reusing the key's row or evicting the LRU one (lock held)"""
+        if self._vectors is None:
+            self._vectors = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            slot = self._free.pop() if self._free else self._slots.popitem(last=False)[1]
+        self._slots[key] = slot
+        self._vectors[slot] = vector
+        self._expires[slot] = expires_at
+        self._values[slot] = (key, value)
+    
+    @staticmethod
+    def _sidecar_path(path: str) -> str:
+        return os.path.splitext(path)[0] + ".json"
+    
+    def save(self, path: str) -> None:
+        """Write live entries to `path` (.npz of vectors) and a .json sidecar of keys and values"""
+        now = time.time()
+        with self._lock:
+            slots = [slot for slot in self._slots.values() if self._expires[slot] > now]
+            if not slots:
+                return
+            vectors = self._vectors[slots]
+            entries = [
+                {"key": self._values[slot][0], "expires_at": float(self._expires[slot]), "value": self._values[slot][1]}
+                for slot in slots
+            ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write to temp files and swap them in, so a kill mid-save (this runs from atexit)
+        # leaves the previous cache intact instead of a truncated one
+        sidecar = self._sidecar_path(path)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, vectors=vectors)
+        with open(sidecar + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(sidecar + ".tmp", sidecar)
+        os.replace(path + ".tmp", path)
+    
+    def load(self, path: str) -> None:
+        """Restore entries written by save(), skipping expired ones; a missing file is a no-op"""
+        if not os.path.exists(path):
+            return
+        with np.load(path) as archive:
+            vectors = archive["vectors"]
+        with open(self._sidecar_path(path), encoding="utf-8") as f:
+            entries = json.load(f)
+        if len(entries) != len(vectors):
+            raise ValueError(f"{path}: {len(vectors)} vectors for {len(entries)} entries")
+        now = time.time()
+        with self._lock:
+            # Saved least recently used first, so replaying keeps the LRU order
+            for entry, vector in zip(entries, vectors):
+                if entry["expires_at"] > now:
+                    self._store(entry["key"], entry["expires_at"], vector, entry["value"])
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency is down.
+    
+    After `failure_threshold` consecutive failures the breaker opens and
+    `allow()` refuses calls. Once `reset_timeout` seconds have passed it lets
+    a single trial call through (half-open): success closes the breaker,
+    failure opens it again for twice as long, up to `max_reset_timeout`, so a
+    long outage is probed less and less often.
+    """
+    
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_reset_timeout: float = 300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(max_reset_timeout, reset_timeout)
+        self._cooldown = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self._cooldown:
+                return "half-open"
+            return "open"
+    
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self._cooldown:
+                return False
+            # Half-open: this caller is the trial; everyone else waits another period
+            self._opened_at = now
+            self._trial_in_flight = True
+            return True
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+            self._cooldown = self.reset_timeout
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("[%s] %s circuit opened after %d consecutive failures",
+                                   _REQUEST_ID.get(), self.name, self._failures)
+                elif self._trial_in_flight:
+                    # The half-open trial failed too: back off further before the next one.
+                    # Calls already in flight when the breaker opened don't count
+                    self._trial_in_flight = False
+                    self._cooldown = min(self._cooldown * 2, self.max_reset_timeout)
+                    logger.warning("[%s] %s circuit stays open; next trial in %.0fs",
+                                   _REQUEST_ID.get(), self.name, self._cooldown)
+                self._opened_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Coalesce blocking calls that arrive close together into one batched call.
+    
+    The first caller in an empty batch becomes its leader: it waits `window`
+    seconds for others to queue up (or until `max_batch` items are waiting),
+    then runs `batch_fn` once over every queued item. `batch_fn` must return
+    results in input order; if it raises, every caller in the batch sees the error.
+    """
+    
+    def __init__(self, batch_fn, max_batch: int = 16, window: float = 0.02):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self._pending = []
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+    
+    def submit(self, item):
+        """Queue `item`, block until its batch has run and return its result"""
+        future = Future()
+        with self._lock:
+            self._pending.append((item, future))
+            is_leader = len(self._pending) == 1
+            if is_leader:
+                self._full.clear()
+            elif len(self._pending) >= self.max_batch:
+                self._full.set()
+        if is_leader:
+            self._full.wait(self.window)
+            self._flush()
+        return future.result()
+    
+    def _flush(self) -> None:
+        # Items queued past max_batch were never handed a leader, so keep draining
+        more = True
+        while more:
+            with self._lock:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                more = bool(self._pending)
+            if batch:
+                self._run(batch)
+    
+    def _run(self, batch) -> None:
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+def _normalize_query(query: str) -> str:
+    """Cache key form of a query: lower-case with collapsed whitespace"""
+    return " ".join(query.lower().split())
+
+
+# Punctuation never changes what a query should be rewritten to
+_PUNCTUATION_TO_SPACE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+
+def _canonical_query(query: str) -> str:
+    """Looser key for optimizer results: also ignores punctuation ("Paris, France?" == "paris france")"""
+    return _normalize_query(query.translate(_PUNCTUATION_TO_SPACE))
+
+
+@functools.lru_cache(maxsize=1)
+def _get_browser():
+    """Shared Hyperbrowser tool, built on first use (imported lazily - most requests never need it)"""
+    from langchain_hyperbrowser import HyperbrowserBrowserUseTool
+    return HyperbrowserBrowserUseTool()
+
+
+# Stop calling a provider that keeps failing instead of making every request wait on it
+_SERPER_BREAKER = CircuitBreaker("serper", failure_threshold=5, reset_timeout=30, max_reset_timeout=300)
+_BROWSER_BREAKER = CircuitBreaker("browser", failure_threshold=3, reset_timeout=60, max_reset_timeout=600)
+
+# Search results go stale slowly; optimized queries, plans and tool decisions are stable for much longer
+_SERPER_CACHE = TTLCache(maxsize=2048, ttl=600)
+_OPTIMIZE_CACHE = TTLCache(maxsize=4096, ttl=3600)
+
+# A browser run takes seconds to tens of seconds, so keep its results a while
+_BROWSER_CACHE = TTLCache(maxsize=256, ttl=900)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_embeddings():
+    """Shared OpenAI embeddings client, built on first use"""
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model="text-embedding-3-small", api_key=OPENAI_API_KEY)
+
+
+def _embed_batch(texts: list) -> list:
+    """Embed several texts with a single OpenAI request"""
+    return _get_embeddings().embed_documents(texts)
+
+
+# Concurrent cache lookups (and bulk warm-ups) share one embeddings request
+_EMBED_BATCHER = MicroBatcher(_embed_batch, max_batch=32, window=0.02)
+
+
+@functools.lru_cache(maxsize=1024)
+def _embed_query(text: str):
+    """Embedding of a (normalized) query; memoized so get-then-set embeds once"""
+    # float32 keeps each memo entry ~6 KB (a tuple of Python floats is ~50 KB);
+    # read-only because every caller shares the cached array
+    vector = np.asarray(_EMBED_BATCHER.submit(text), dtype=np.float32)
+    vector.flags.writeable = False
+    return vector
+
+
+# Rephrasings of the same browser search ("top Paris hotels" / "best hotels in
+# Paris") reuse one run. Single Serper searches don't get this tier: an embedding
+# call costs about as much as the request it would save
+_BROWSER_SEMANTIC_CACHE = SemanticCache(
+    lambda text: _embed_query(_normalize_query(text)), maxsize=256, ttl=900, threshold=0.95
 )
 
+# Whole research_query results (an LLM rewrite plus two Serper calls) for similar
+# questions, kept for a day and persisted across restarts. 0.95 keeps "hotels in
+# Paris" and "hotels in Rome" apart
+_RESEARCH_SEMANTIC_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "research_cache.npz"
+)
+_RESEARCH_SEMANTIC_CACHE = SemanticCache(
+    lambda text: _embed_query(_normalize_query(text)), maxsize=1024, ttl=86400, threshold=0.95
+)
+try:
+    _RESEARCH_SEMANTIC_CACHE.load(_RESEARCH_SEMANTIC_CACHE_PATH)
+except Exception as e:  # a damaged cache file must never stop the server from starting
+    logger.warning("ignoring unreadable research cache %s: %s", _RESEARCH_SEMANTIC_CACHE_PATH, e)
+atexit.register(_RESEARCH_SEMANTIC_CACHE.save, _RESEARCH_SEMANTIC_CACHE_PATH)
+
+# Below the cache's own threshold results may differ, but a search query written for a
+# question this close is still a good one, so research_query reuses it instead of calling the LLM
+_REUSE_OPTIMIZED_THRESHOLD = 0.85
+
+
+def _reuses_cleanly(query: str, optimized_query: str) -> bool:
+    """Whether a borrowed optimized query still mentions every content word of `query`
+    (guards against "hotels in Rome" picking up the query written for Paris)"""
+    optimized = optimized_query.lower()
+    return all(word in optimized for word in _canonical_query(query).split() if len(word) > 3)
+
+# Results kept for follow-up turns ("filter those under $200") so they can
+# reuse earlier research instead of repeating the searches
+_RESULT_CACHE = TTLCache(maxsize=256, ttl=3600)
+
+
+def _research_cache_key(query: str) -> str:
+    """Stable result-cache key for a research query"""
+    digest = hashlib.sha1(_normalize_query(query).encode("utf-8")).hexdigest()[:16]
+    return f"research::{digest}"
+
+
+# Fields worth passing on from each Serper result type; everything else
+# (sitelinks, thumbnails, CIDs, ...) just inflates downstream LLM context
+_SERPER_FIELDS = {
+    # Single-object sections carrying direct answers ("best time to visit Kyoto"); listed first
+    # so they lead the output as they did with GoogleSerperAPIWrapper
+    "answerBox": ("title", "answer", "snippet", "link"),
+    "knowledgeGraph": ("title", "type", "description", "website", "attributes"),
+    "organic": ("title", "link", "snippet"),
+    "places": ("title", "address", "rating", "ratingCount", "category", "phoneNumber", "website"),
+}
+_SERPER_MAX_RESULTS = 10
+
+
+def _dumps(obj) -> bytes:
+    """Encode to compact UTF-8 JSON, preferring orjson when it is installed"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(payload: bytes):
+    """Decode a JSON response body, preferring orjson when it is installed"""
+    return orjson.loads(payload) if orjson else json.loads(payload)
+
+
+def _compact_serper_payload(payload: dict) -> str:
+    """Project a parsed Serper response down to the fields we use, as compact JSON"""
+    trimmed = {}
+    for section, fields in _SERPER_FIELDS.items():
+        items = payload.get(section)
+        if isinstance(items, dict):
+            projected = {field: items[field] for field in fields if field in items}
+            if projected:
+                trimmed[section] = projected
+        elif items:
+            trimmed[section] = [
+                {field: item[field] for field in fields if field in item}
+                for item in items[:_SERPER_MAX_RESULTS]
+            ]
+    return _dumps(trimmed).decode("utf-8")
+
+
 # Helper function for Serper API calls
 def call_serper_api(endpoint: str, query: str) -> str:
-    """Make API call to Serper endpoint"""
-    serper_key = os.getenv("SERPER_API_KEY")
+    """Make API call to Serper endpoint and return the trimmed results as JSON (cached)"""
+    cache_key = (endpoint, _normalize_query(query))
+    cached = _SERPER_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
     url = f"https://google.serper.dev/{endpoint}"
-    headers = {
-        'X-API-KEY': serper_key,
-        'Content-Type': 'application/json'
-    }
-    data = json.dumps({"q": query})
+    label = "web" if endpoint == "search" else endpoint
+    
+    if not _SERPER_BREAKER.allow():
+        return f"{label} search error: Serper is failing repeatedly; skipping for now"
     
     try:
-        response = requests.post(url, headers=headers, data=data)
-        return response.text
-    except Exception as e:
-        return f"{endpoint} search error: {str(e)}"
+        with _SERPER_SLOTS:
+            response = _HTTP.post(url, data=_dumps({"q": query}), timeout=SERPER_TIMEOUT)
+        if response.status_code != 200:
+            # Only throttling and server errors say Serper itself is unhealthy
+            if response.status_code == 429 or response.status_code >= 500:
+                _SERPER_BREAKER.record_failure()
+            else:
+                _SERPER_BREAKER.record_success()
+            return f"{label} search error: HTTP {response.status_code} {response.text}"
+        result = _compact_serper_payload(_loads(response.content))
+        _SERPER_BREAKER.record_success()
+        _SERPER_CACHE.set(cache_key, result)
+        return result
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("[%s] %s search failed: %s", _REQUEST_ID.get(), label, e)
+        _SERPER_BREAKER.record_failure()
+        return f"{label} search error: {str(e)}"
+
+# Keywords that make the right search tool obvious without asking the LLM
+_PLACES_RE = re.compile(r"\b(hotels?|hostels?|restaurants?|cafes?|bars?|museums?|attractions?|parks?|beach(es)?)\b", re.I)
+_WEB_RE = re.compile(r"\b(guides?|tips|itinerar(y|ies)|best time|reviews?|blogs?|how to)\b", re.I)
+
+
+def _keyword_decision(query: str) -> Optional[str]:
+    """Tool choice for unambiguous queries, or None when the LLM should decide"""
+    wants_places = _PLACES_RE.search(query) is not None
+    wants_web = _WEB_RE.search(query) is not None
+    if wants_places == wants_web:
+        return None
+    return "places_search" if wants_places else "web_search"
+
+
+# Signals that a query needs live page data that only browser automation can get
+_NEEDS_BROWSER_RE = re.compile(r"\b(book(ing)?|prices?|pricing|availability|tonight|tomorrow|live|current)\b", re.I)
+
+
+# Real-time questions that search snippets can't answer, so the browser is certain to be needed
+_LIVE_DATA_RE = re.compile(r"\b(availability|available|tonight|live|right now)\b", re.I)
+
+# Concrete prices in search results ("$129", "85 EUR", "per night"), which make a browser run redundant
+_PRICING_RE = re.compile(r"[$€£¥]\s?\d|\b\d[\d,.]*\s?(usd|eur|gbp)\b|\bper night\b", re.I)
+
+
+# Budget for free-text tool output (the browser's page extracts) handed back to the client LLM
+_MAX_TOOL_OUTPUT_TOKENS = 2000
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoder():
+    """Shared tiktoken encoder for the configured model (loading BPE tables is slow, so once)"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(llm.model_name)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _count_tokens(text: str) -> int:
+    return len(_get_encoder().encode(text, disallowed_special=()))
+
+
+def _compact(text: str, query: str, max_tokens: int = _MAX_TOOL_OUTPUT_TOKENS) -> str:
+    """
+    Shrink long tool output to about `max_tokens`, keeping the paragraphs most relevant to the query.
+    
+    Paragraphs are scored by how many distinct query terms they mention, picked
+    best-first while they fit, and emitted in their original order. The most
+    relevant paragraph is always kept, cut to the budget if it alone exceeds it.
+    """
+    # Tokens are almost never shorter than a character, so short text can skip tokenizing
+    if len(text) <= max_tokens or _count_tokens(text) <= max_tokens:
+        return text
+    
+    paragraphs = [p.strip() for p in _PARAGRAPH_SPLIT_RE.split(text) if p.strip()]
+    if len(paragraphs) == 1:
+        paragraphs = [line.strip() for line in text.splitlines() if line.strip()]
+    terms = {term for term in _normalize_query(query).split() if len(term) > 2}
+    
+    ranked = sorted(
+        range(len(paragraphs)),
+        key=lambda i: sum(term in paragraphs[i].lower() for term in terms),
+        reverse=True
+    )
+    kept, used = [], 0
+    for i in ranked:
+        tokens = _get_encoder().encode(paragraphs[i], disallowed_special=())
+        if not kept and len(tokens) + 1 > max_tokens:
+            # Skipping it would leave nothing (or only weaker paragraphs): keep its head instead
+            paragraphs[i] = _get_encoder().decode(tokens[:max_tokens - 1])
+            tokens = tokens[:max_tokens - 1]
+        size = len(tokens) + 1
+        if used + size <= max_tokens:
+            kept.append(i)
+            used += size
+    
+    compacted = "\n\n".join(paragraphs[i] for i in sorted(kept))
+    omitted = len(paragraphs) - len(kept)
+    if not omitted:
+        return f"{compacted}\n\n[... truncated]"
+    return f"{compacted}\n\n[... {omitted} less relevant paragraphs omitted]"
+
+
+def _is_search_error(result: str) -> bool:
+    """Whether a search helper returned an error message instead of results"""
+    return result.startswith(("web search error", "places search error"))
+
+
+def _needs_optimization(query: str) -> bool:
+    """
+    Decide whether a query is worth an LLM rewrite.
+    
+    Very short queries benefit from expansion, long ones from condensing and
+    natural-language questions or exclamations from being turned into keywords.
+    Anything else (e.g. "hotels in Kyoto near station") is already a good search query.
+    """
+    return len(query.split()) < 3 or len(query) > 120 or "?" in query or "!" in query
+
+
+# Query optimization prompts: one query, or a JSON array of queries from the batcher
+_SYSTEM_PROMPT = """You are a master expert in crafting optimal Google search queries for the Serper API. 
+Return ONLY the optimized search query - no explanations or additional text."""
+
+_BATCH_SYSTEM_PROMPT = """You are a master expert in crafting optimal Google search queries for the Serper API.
+You will receive a JSON array of queries. Give one optimized search query per input
+query, in the same order."""
+
+# The model fills in the list directly, so markdown fences around a bare JSON array can't break parsing
+_BATCH_SCHEMA = {
+    "title": "optimized_queries",
+    "description": "Optimized Google search queries, one per input query and in input order",
+    "type": "object",
+    "properties": {
+        "queries": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["queries"],
+}
+
+# Batches hold up to _OPTIMIZE_BATCH_SIZE queries, so their output budget scales with it
+# rather than sharing the single-answer cap on llm
+_OPTIMIZE_BATCH_SIZE = 16
+_BATCH_TOKENS_PER_QUERY = 48
+_BATCH_OPTIMIZER = llm.model_copy(
+    update={"max_tokens": _OPTIMIZE_BATCH_SIZE * _BATCH_TOKENS_PER_QUERY + 64}
+).with_structured_output(_BATCH_SCHEMA)
+
+# What a batch answer cut off at max_tokens raises, depending on the structured-output method
+_TRUNCATED_REPLY_ERRORS = (OutputParserException,) + (
+    (openai.LengthFinishReasonError,) if hasattr(openai, "LengthFinishReasonError") else ()
+)
+
+# Tool-choice prompt for intelligent_search. The instructions are fixed; only the
+# query at the end is substituted per call
+_DECISION_PROMPT = """Analyze this travel query and decide which search tool(s) to use:
+
+- Choose "web_search" for: general travel information, guides, tips, reviews, recommendations, articles
+- Choose "places_search" for: specific locations, hotels, restaurants, attractions, businesses
+- Choose "browser_search" for: detailed extraction from specific websites, real-time pricing, booking info
+- Choose "comprehensive" if you need information from all three sources for complete research
+
+Respond with ONLY one word: "web_search", "places_search", "browser_search", or "comprehensive"
+
+Query: "{query}"
+"""
+
+# The answer is a single tool name (a few tokens): stop generating right after it
+_DECIDER = llm.bind(max_tokens=8, stop=["\n"])
+
+_OPTIMIZE_USER_PROMPT = 'Original query: "{query}"\nOptimized query:'
+
+# Fused optimize-and-route prompt: one LLM round-trip instead of optimize + decide
+_SEARCH_TOOLS = ("web_search", "places_search", "browser_search", "comprehensive")
+
+_PLAN_SYSTEM_PROMPT = """You are a master expert in crafting optimal Google search queries for the Serper API
+and in choosing the right travel search tool. Give the optimized search query and the tool:
+- "web_search" for: general travel information, guides, tips, reviews, recommendations, articles
+- "places_search" for: specific locations, hotels, restaurants, attractions, businesses
+- "browser_search" for: detailed extraction from specific websites, real-time pricing, booking info
+- "comprehensive" if information from all three sources is needed for complete research"""
+
+_PLAN_USER_PROMPT = 'Original query: "{query}"'
+
+_PLAN_SCHEMA = {
+    "title": "search_plan",
+    "description": "Optimized search query and the search tool to run it with",
+    "type": "object",
+    "properties": {
+        "optimized_query": {"type": "string", "description": "Optimized Google search query"},
+        "tool": {"type": "string", "enum": list(_SEARCH_TOOLS)},
+    },
+    "required": ["optimized_query", "tool"],
+}
+
 
 # Internal helper functions (defined before MCP tools)
-def _optimize_query_internal(user_query: str) -> str:
-    """Internal query optimization function"""
+def _optimize_one(query: str) -> str:
+    """Optimize a single query with its own LLM call"""
+    response = llm.invoke([
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": _OPTIMIZE_USER_PROMPT.format(query=query)}
+    ])
+    return response.content.strip()
+
+
+def _optimize_queries_batch(queries: list) -> list:
+    """Optimize a batch of queries with a single LLM call; results are in input order"""
+    if len(queries) == 1:
+        return [_optimize_one(queries[0])]
+    
     try:
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key or len(openai_key.strip()) == 0:
-            return "Error: OPENAI_API_KEY not found or empty"
-        
-        system_prompt = """You are a master expert in crafting optimal Google search queries for the Serper API. 
-        Return ONLY the optimized search query - no explanations or additional text."""
-        
-        optimization_prompt = f'Original query: "{user_query}"\nOptimized query:'
-        
-        response = llm.invoke([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": optimization_prompt}
+        batch = _BATCH_OPTIMIZER.invoke([
+            {"role": "system", "content": _BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": json.dumps(queries, ensure_ascii=False)}
         ])
+    except _TRUNCATED_REPLY_ERRORS:
+        batch = None  # Cut off mid-answer; handled like any other unusable answer below
+    optimized = batch.get("queries") if isinstance(batch, dict) else None
+    if (not isinstance(optimized, list) or len(optimized) != len(queries)
+            or not all(isinstance(q, str) for q in optimized)):
+        # A malformed or misaligned batch answer shouldn't fail every caller in it
+        logger.warning("[%s] batched optimization returned an unusable answer; optimizing %d queries one by one",
+                       _REQUEST_ID.get(), len(queries))
+        return [_optimize_one(query) for query in queries]
+    return [q.strip() or query for q, query in zip(optimized, queries)]
+
+
+# Concurrent optimization requests share one OpenAI round-trip instead of one each
+_OPTIMIZE_BATCHER = MicroBatcher(_optimize_queries_batch, max_batch=_OPTIMIZE_BATCH_SIZE, window=0.02)
+
+
+def _optimize_query_cached(user_query: str) -> str:
+    """Optimized form of a query (cached); raises if the LLM call fails so failures aren't cached"""
+    cache_key = _canonical_query(user_query)
+    cached = _OPTIMIZE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    optimized_query = _OPTIMIZE_BATCHER.submit(user_query)
+    _OPTIMIZE_CACHE.set(cache_key, optimized_query)
+    return optimized_query
+
+
+def _optimize_query_internal(user_query: str) -> str:
+    """Internal query optimization function (successful results are cached)"""
+    try:
+        return _optimize_query_cached(user_query)
         
-        return response.content.strip()
-        
-    except Exception as e:
+    except (openai.OpenAIError, ValueError) as e:
         return f"Error optimizing query: {str(e)}"
 
 
-def _web_search_internal(query: str) -> str:
-    """Internal web search function"""
+# The model fills in _PLAN_SCHEMA directly, so there is no free-form JSON to parse
+_PLANNER = llm.with_structured_output(_PLAN_SCHEMA)
+
+
+def _plan_query_internal(user_query: str) -> dict:
+    """Optimized query and search tool from a single LLM call (cached); raises if the call fails"""
+    cache_key = ("plan", _canonical_query(user_query))
+    cached = _OPTIMIZE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    plan = _PLANNER.invoke([
+        {"role": "system", "content": _PLAN_SYSTEM_PROMPT},
+        {"role": "user", "content": _PLAN_USER_PROMPT.format(query=user_query)}
+    ])
+    if not isinstance(plan, dict):
+        raise ValueError(f"planner returned {type(plan).__name__}, expected a search plan")
+    tool = str(plan.get("tool", "")).strip().lower()
+    if tool not in _SEARCH_TOOLS:
+        raise ValueError(f"unknown search tool: {tool!r}")
+    plan = {
+        "optimized_query": str(plan.get("optimized_query") or "").strip() or user_query,
+        "tool": tool
+    }
+    _OPTIMIZE_CACHE.set(cache_key, plan)
+    return plan
+
+
+def _decide_tool(query: str) -> str:
+    """Search tool the LLM picks for a query (cached when it is one of _SEARCH_TOOLS)"""
+    cache_key = ("decision", _canonical_query(query))
+    cached = _OPTIMIZE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    response = _DECIDER.invoke([
+        {"role": "user", "content": _DECISION_PROMPT.format(query=query)}
+    ])
+    decision = response.content.strip().strip("\"'.").lower()
+    # Off-list answers fall back to a comprehensive search; ask again next time
+    if decision in _SEARCH_TOOLS:
+        _OPTIMIZE_CACHE.set(cache_key, decision)
+    return decision
+
+
+def _optimize_or_original(query: str) -> str:
+    """Optimized query when a rewrite is worthwhile and succeeds, otherwise the query itself"""
+    if not _needs_optimization(query):
+        return query
     try:
-        # Ensure environment is set for Serper
-        serper_key = os.getenv("SERPER_API_KEY")
-        if serper_key:
-            os.environ["SERPER_API_KEY"] = serper_key
-        
-        search = GoogleSerperAPIWrapper()
-        return search.run(query)
-    except Exception as e:
-        return f"Web search error: {str(e)}"
+        return _optimize_query_cached(query)
+    except (openai.OpenAIError, ValueError):
+        return query  # Use original if optimization fails
+
+
+def _web_search_internal(query: str) -> str:
+    """Internal web search function (call_serper_api caches and reports its own errors)"""
+    return call_serper_api("search", query)
 
 
 def _places_search_internal(query: str) -> str:
-    """Internal places search function"""
-    try:
-        return call_serper_api("places", query)
-    except Exception as e:
-        return f"Places search error: {str(e)}"
+    """Internal places search function (call_serper_api reports its own errors)"""
+    return call_serper_api("places", query)
+
+
+def _cache_late_browser_result(run: Future, cache_key: str, query: str) -> None:
+    """Done-callback for a browser run whose caller timed out: cache it if it succeeded"""
+    if not run.cancelled() and run.exception() is None:
+        _BROWSER_CACHE.set(cache_key, _compact(run.result(), query))
 
 
 def _browser_search_internal(query: str) -> str:
-    """Internal browser search function"""
+    """Internal browser search function (successful results are cached, exactly and by similarity)"""
+    cache_key = _normalize_query(query)
+    cached = _BROWSER_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    use_semantic = True
+    try:
+        cached = _BROWSER_SEMANTIC_CACHE.get(query)
+        if cached is not None:
+            return cached
+    except (openai.OpenAIError, ValueError):
+        use_semantic = False  # Embedding failed; fall through to a real browser run
+    
+    if not _BROWSER_BREAKER.allow():
+        return "Browser search error: browser automation is failing repeatedly; skipping for now"
+    
     try:
-        browser_tool = HyperbrowserBrowserUseTool()
         search_instruction = f"Search for '{query}' and extract detailed information including reviews, prices, contact details, and recommendations"
-        return browser_tool.run(search_instruction)
-    except Exception as e:
+        run = _BROWSER_POOL.submit(_get_browser().run, search_instruction)
+        result = _compact(run.result(timeout=BROWSER_TIMEOUT), query)
+    except FutureTimeoutError:
+        if run.cancel():
+            # Still queued behind other runs: the pool is busy, not Hyperbrowser broken,
+            # and cancelling spares a billed run whose result nobody would read
+            logger.warning("[%s] browser search waited %ss for a free worker", _REQUEST_ID.get(), BROWSER_TIMEOUT)
+            return f"Browser search error: no browser worker free within {BROWSER_TIMEOUT}s"
+        logger.warning("[%s] browser search timed out after %ss", _REQUEST_ID.get(), BROWSER_TIMEOUT)
+        _BROWSER_BREAKER.record_failure()
+        # The run can't be stopped, so at least keep a late success for the next identical query
+        run.add_done_callback(lambda done: _cache_late_browser_result(done, cache_key, query))
+        return f"Browser search error: timed out after {BROWSER_TIMEOUT}s"
+    except Exception as e:  # Hyperbrowser doesn't expose a common base exception
+        logger.warning("[%s] browser search failed: %s", _REQUEST_ID.get(), e)
+        _BROWSER_BREAKER.record_failure()
         return f"Browser search error: {str(e)}"
+    
+    _BROWSER_BREAKER.record_success()
+    _BROWSER_CACHE.set(cache_key, result)
+    if use_semantic:
+        _BROWSER_SEMANTIC_CACHE.set(query, result)
+    return result
+
+def _run_searches(query: str, *search_functions, started: Optional[dict] = None):
+    """
+    Run independent search functions concurrently; results come back in argument order.
+    
+    `started` maps search functions to futures already running for this query
+    (e.g. speculative prefetches), which are reused instead of resubmitted.
+    """
+    started = started or {}
+    futures = [started.get(search) or _SEARCH_POOL.submit(search, query) for search in search_functions]
+    return [future.result() for future in futures]
+
+
+# Fixed parts of the research_agent report
+_BANNER = "=" * 80
+_SECTION_WEB = f"\n{_BANNER}\nWEB SEARCH - Travel Guides & Articles\n{_BANNER}\n"
+_SECTION_PLACES = f"\n\n{_BANNER}\nPLACES & LOCATIONS - Hotels, Restaurants, Attractions\n{_BANNER}\n"
+_SECTION_DONE = f"\n\n{_BANNER}\nResearch Complete!\n{_BANNER}"
+
 
 # ============================================================================
-# MAIN MCP TOOL - ONLY EXPOSED ENDPOINT
+# MCP TOOLS - EXPOSED ENDPOINTS
 # ============================================================================
+async def _report_progress(ctx: Optional[Context], progress: int, total: int, message: str) -> None:
+    """Send a progress update and log line to the MCP client (no-op outside a tool call)"""
+    if ctx is None:
+        return
+    try:
+        await ctx.report_progress(progress, total)
+        await ctx.info(message)
+    except Exception as e:  # the client may be gone while a shared run carries on
+        logger.debug("[%s] progress update dropped: %s", _REQUEST_ID.get(), e)
+
+
+# research_agent runs in progress, keyed by normalized query. Only touched from the
+# event loop (no await between lookup and insert), so it needs no lock
+_INFLIGHT_RESEARCH = {}
+
+# Background runs from start_research, by task id. Running ones live in a plain dict so
+# they are never evicted; finished ones move to the TTL cache and stay pollable for an hour
+_RUNNING_RESEARCH_TASKS = {}
+_RESEARCH_TASKS = TTLCache(maxsize=256, ttl=3600)
+
+
 @mcp.tool()
-def research_agent(query: str) -> str:
+async def research_agent(query: str, ctx: Context = None) -> str:
     """
     Fast travel research agent - optimized for quick results.
     
     Searches web content and places/locations to provide comprehensive
     travel information including hotels, restaurants, attractions, and tips.
+    Progress is reported to the client as each step finishes.
     
     Args:
         query: Your travel question or destination
@@ -120,168 +970,329 @@ def research_agent(query: str) -> str:
     Returns:
         Comprehensive travel research results
     """
-    try:
-        # Step 1: Optimize query for better search results
-        optimized_query = query
-        try:
-            openai_key = os.getenv("OPENAI_API_KEY")
-            if openai_key and len(openai_key.strip()) > 0:
-                system_prompt = """You are a travel research expert. Optimize this query for Google search.
-                Return ONLY the optimized search query - no explanations."""
-                
-                response = llm.invoke([
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f'Query: "{query}"\nOptimized:'}
-                ])
-                optimized_query = response.content.strip()
-        except:
-            pass  # Use original if optimization fails
-        
-        # Step 2: Execute fast searches
-        results = []
-        results.append(f"Travel Research Results for: {query}")
-        results.append("=" * 80)
-        results.append(f"Optimized Search: {optimized_query}\n")
-        
-        # Web search for guides and articles
-        results.append("\n" + "=" * 80)
-        results.append("WEB SEARCH - Travel Guides & Articles")
-        results.append("=" * 80)
-        try:
-            web_result = _web_search_internal(optimized_query)
-            results.append(web_result)
-        except Exception as e:
-            results.append(f"Web search error: {str(e)}")
-        
-        # Places search for specific locations
-        results.append("\n\n" + "=" * 80)
-        results.append("PLACES & LOCATIONS - Hotels, Restaurants, Attractions")
-        results.append("=" * 80)
-        try:
-            places_result = _places_search_internal(optimized_query)
-            results.append(places_result)
-        except Exception as e:
-            results.append(f"Places search error: {str(e)}")
-        
-        results.append("\n\n" + "=" * 80)
-        results.append("Research Complete!")
-        results.append("=" * 80)
-        
-        return "\n".join(results)
-        
-    except Exception as e:
-        return f"Error in research_agent: {str(e)}"
+    return await _research(query, ctx)
+
+
+@mcp.tool()
+async def start_research(query: str) -> str:
+    """
+    Start travel research in the background and return immediately.
+    
+    Use this instead of research_agent when the client can't wait for the
+    full search; poll get_research_status with the returned task_id.
+    
+    Args:
+        query: Your travel question or destination
+    
+    Returns:
+        JSON with the task_id and status "RUNNING"
+    """
+    task_id = uuid.uuid4().hex
+    task = asyncio.ensure_future(_research(query, None))
+    _RUNNING_RESEARCH_TASKS[task_id] = task
+    
+    def finished(done):
+        _RESEARCH_TASKS.set(task_id, done)
+        _RUNNING_RESEARCH_TASKS.pop(task_id, None)
+    
+    task.add_done_callback(finished)
+    return json.dumps({"task_id": task_id, "status": "RUNNING"})
+
+
+@mcp.tool()
+def get_research_status(task_id: str) -> str:
+    """
+    Check on research started with start_research.
+    
+    Args:
+        task_id: The task_id returned by start_research
+    
+    Returns:
+        JSON with status RUNNING, COMPLETED (with the report as "response"),
+        FAILED (with "error") or UNKNOWN for unknown or expired task ids
+    """
+    task = _RUNNING_RESEARCH_TASKS.get(task_id) or _RESEARCH_TASKS.get(task_id)
+    if task is None:
+        return json.dumps({"task_id": task_id, "status": "UNKNOWN", "error": "unknown or expired task id"})
+    if not task.done():
+        return json.dumps({"task_id": task_id, "status": "RUNNING"})
+    if task.cancelled():
+        return json.dumps({"task_id": task_id, "status": "FAILED", "error": "research was cancelled"})
+    if task.exception() is not None:
+        return json.dumps({"task_id": task_id, "status": "FAILED", "error": str(task.exception())})
+    return json.dumps({"task_id": task_id, "status": "COMPLETED", "response": task.result()}, ensure_ascii=False)
 
 
-@tool
-def web_search_tool(search_query: str) -> str:
-    """Search the web for travel guides, reviews, and general information"""
-    return _web_search_internal(search_query)
+async def _research(query: str, ctx: Optional[Context]) -> str:
+    """Run the research pipeline, sharing the run with identical requests already in flight"""
+    key = _normalize_query(query)
+    running = _INFLIGHT_RESEARCH.get(key)
+    if running is not None:
+        logger.info("[%s] joining in-flight research for %r", _REQUEST_ID.get(), query)
+        # Shielded so a cancelled duplicate doesn't cancel the shared run
+        return await asyncio.shield(running)
+    
+    task = asyncio.ensure_future(_run_research(query, ctx))
+    _INFLIGHT_RESEARCH[key] = task
+    
+    def forget(done):
+        if _INFLIGHT_RESEARCH.get(key) is done:
+            del _INFLIGHT_RESEARCH[key]
+    
+    # The entry goes when the run ends, not when this caller leaves: followers
+    # (and start_research runs) may still be waiting on it
+    task.add_done_callback(forget)
+    # Shielded too, so the first caller's timeout or disconnect doesn't cancel it for everyone
+    return await asyncio.shield(task)
 
 
-@tool
-def places_search_tool(search_query: str) -> str:
-    """Search for specific places, hotels, restaurants, and attractions"""
-    return _places_search_internal(search_query)
+def _in_executor(loop, executor, func, *args):
+    """loop.run_in_executor that carries the caller's context variables (request id) into the worker"""
+    return loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, func, *args))
 
-@tool
-def browser_search_tool(search_query: str) -> str:
-    """Use advanced browser automation to search and extract detailed information from websites"""
-    return _browser_search_internal(search_query)
+
+async def _run_research(query: str, ctx: Optional[Context]) -> str:
+    """The research_agent pipeline: optimize, search web and places concurrently, build the report"""
+    _REQUEST_ID.set(uuid.uuid4().hex[:8])
+    started_at = time.perf_counter()
+    logger.info("[%s] research started: %r", _REQUEST_ID.get(), query)
+    
+    # Step 1: Optimize query for better search results
+    loop = asyncio.get_running_loop()
+    optimized_query = await _in_executor(loop, None, _optimize_or_original, query)
+    await _report_progress(ctx, 1, 3, f"Searching for: {optimized_query}")
+    
+    # Step 2: Execute fast searches - web and places are independent, so run them concurrently
+    # and tell the client about each one as soon as it lands
+    searches = {
+        _in_executor(loop, _SEARCH_POOL, _web_search_internal, optimized_query): "Web search",
+        _in_executor(loop, _SEARCH_POOL, _places_search_internal, optimized_query): "Places search",
+    }
+    pending = set(searches)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for search in done:
+            await _report_progress(ctx, 3 - len(pending), 3, f"{searches[search]} finished")
+    web_result, places_result = await asyncio.gather(*searches, return_exceptions=True)
+    
+    cache_key = _research_cache_key(query)
+    _RESULT_CACHE.set(cache_key, json.dumps({
+        "query": query,
+        "optimized_query": optimized_query,
+        "web_results": None if isinstance(web_result, Exception) else web_result,
+        "places_results": None if isinstance(places_result, Exception) else places_result
+    }, ensure_ascii=False))
+    
+    # Write straight into one buffer rather than holding every section in a list and joining
+    buf = io.StringIO()
+    buf.write(f"Travel Research Results for: {query}\n")
+    buf.write(_BANNER + "\n")
+    buf.write(f"Optimized Search: {optimized_query}\n")
+    buf.write(f"Cache Key: {cache_key} (pass to get_results_from_cache to reuse these results)\n\n")
+    
+    # Web search for guides and articles
+    buf.write(_SECTION_WEB)
+    if isinstance(web_result, Exception):
+        buf.write(f"Web search error: {str(web_result)}\n")
+    else:
+        buf.write(f"{web_result}\n")
+    
+    # Places search for specific locations
+    buf.write(_SECTION_PLACES)
+    if isinstance(places_result, Exception):
+        buf.write(f"Places search error: {str(places_result)}\n")
+    else:
+        buf.write(f"{places_result}\n")
+    
+    buf.write(_SECTION_DONE)
+    
+    logger.info("[%s] research finished in %.2fs", _REQUEST_ID.get(), time.perf_counter() - started_at)
+    return buf.getvalue()
+
+
+@mcp.tool()
+def save_to_cache(key: str, value: str) -> str:
+    """
+    Store a value (e.g. filtered or re-ranked results) for later tool calls.
+    
+    Args:
+        key: Name to store the value under
+        value: Text or JSON to store
+    
+    Returns:
+        Confirmation with the key to use in get_results_from_cache
+    """
+    _RESULT_CACHE.set(key, value)
+    return f"Saved under key: {key}"
+
+
+@mcp.tool()
+def get_results_from_cache(key: str) -> str:
+    """
+    Retrieve results stored by research_agent or save_to_cache.
+    
+    Use this on follow-up questions instead of re-running the same research.
+    
+    Args:
+        key: Cache key returned by research_agent or passed to save_to_cache
+    
+    Returns:
+        The stored value, or an error message if the key is unknown or expired
+    """
+    value = _RESULT_CACHE.get(key)
+    if value is None:
+        return f"Error: no cached results for key '{key}' (unknown or expired)"
+    return value
 
 
 def optimize_search_query(user_query: str) -> str:
     """Optimize and refactor user query for better Serper Google search results"""
     return _optimize_query_internal(user_query)
 
-def intelligent_search(optimized_query: str) -> str:
-    """Analyze the query and decide which search tool to use, then execute it """
+def plan_and_search(user_query: str) -> str:
+    """Optimize the query and choose the search tool in one LLM call, then run the search"""
     try:
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key:
-            return "Error: OPENAI_API_KEY not found"
-        
-        # Use main LLM for decision making
-        decision_maker = llm
-        
-        # Decision prompt
-        decision_prompt = f"""
-        Query: "{optimized_query}"
-        
-        Analyze this travel query and decide which search tool(s) to use:
-        
-        - Choose "web_search" for: general travel information, guides, tips, reviews, recommendations, articles
-        - Choose "places_search" for: specific locations, hotels, restaurants, attractions, businesses  
-        - Choose "browser_search" for: detailed extraction from specific websites, real-time pricing, booking info
-        - Choose "comprehensive" if you need information from all three sources for complete research
-        
-        Respond with ONLY one word: "web_search", "places_search", "browser_search", or "comprehensive"
-        """
-        
-        # Get decision
-        response = decision_maker.invoke([{"role": "user", "content": decision_prompt}])
-        decision = response.content.strip().lower()
+        plan = _plan_query_internal(user_query)
+    except (openai.OpenAIError, ValueError) as e:
+        return f"Error planning search: {str(e)}"
+    return intelligent_search(plan["optimized_query"], decision=plan["tool"])
+
+
+@mcp.tool()
+async def search_travel(query: str) -> str:
+    """
+    Quick single-source travel search.
+    
+    Rewrites the query and picks the best search tool (web, places, browser or
+    all of them) in one step, then runs only what's needed. Faster than
+    research_agent when one kind of result is enough.
+    
+    Args:
+        query: Your travel question or destination
+    
+    Returns:
+        The chosen search tool and its results
+    """
+    _REQUEST_ID.set(uuid.uuid4().hex[:8])
+    loop = asyncio.get_running_loop()
+    return await _in_executor(loop, None, plan_and_search, query)
+
+
+# Decisions that run exactly one search tool, with the label used in the result
+_SINGLE_SEARCHES = {
+    "web_search": ("Web Search", _web_search_internal),
+    "places_search": ("Places Search", _places_search_internal),
+    "browser_search": ("Browser Search", _browser_search_internal),
+}
+
+
+def _comprehensive_report(web_result: str, places_result: str, browser_result: str) -> str:
+    """intelligent_search output for a comprehensive decision, built in a single join"""
+    return "\n\n".join((
+        "Decision: Comprehensive Search",
+        "Web Search Results:\n" + web_result,
+        "Places Search Results:\n" + places_result,
+        "Browser Search Results:\n" + browser_result,
+    ))
+
+
+def intelligent_search(optimized_query: str, decision: Optional[str] = None) -> str:
+    """
+    Analyze the query and decide which search tool to use, then execute it.
+    
+    Pass `decision` (one of _SEARCH_TOOLS) when it is already known, e.g. from
+    plan_and_search, to skip the decision step.
+    """
+    prefetched = {}
+    try:
+        # Clear-cut queries are routed by keyword; only ambiguous ones cost an LLM round-trip
+        if decision is None:
+            decision = _keyword_decision(optimized_query)
+        if decision is None:
+            # Serper searches are cheap, idempotent and cached, so start them while the LLM
+            # decides; most decisions need at least one of them. The browser is too costly to guess
+            prefetched = {
+                search: _SEARCH_POOL.submit(search, optimized_query)
+                for search in (_web_search_internal, _places_search_internal)
+            }
+            
+            decision = _decide_tool(optimized_query)
         
-        # Set environment for Serper
-        serper_key = os.getenv("SERPER_API_KEY")
-        os.environ["SERPER_API_KEY"] = serper_key
+        # Single-tool decisions: reuse the prefetch if there is one, otherwise run inline
+        single = _SINGLE_SEARCHES.get(decision)
+        if single is not None:
+            label, search = single
+            future = prefetched.get(search)
+            result = future.result() if future is not None else search(optimized_query)
+            return "".join(("Decision: ", label, "\nResults:\n", result))
         
-        # Execute based on decision using clean internal functions
-        if decision == "web_search":
-            result = _web_search_internal(optimized_query)
-            return f"Decision: Web Search\nResults:\n{result}"
-        elif decision == "places_search":
-            result = _places_search_internal(optimized_query)
-            return f"Decision: Places Search\nResults:\n{result}"
-        elif decision == "browser_search":
-            result = _browser_search_internal(optimized_query)
-            return f"Decision: Browser Search\nResults:\n{result}"
+        if decision == "comprehensive" and _LIVE_DATA_RE.search(optimized_query):
+            # Live availability never shows up in search snippets, so the browser will run
+            # anyway: start it first (it's the longest pole) and overlap Serper with it
+            browser_result, web_result, places_result = _run_searches(
+                optimized_query, _browser_search_internal, _web_search_internal, _places_search_internal,
+                started=prefetched
+            )
+            return _comprehensive_report(web_result, places_result, browser_result)
         elif decision == "comprehensive":
-            web_result = _web_search_internal(optimized_query)
-            places_result = _places_search_internal(optimized_query)
-            browser_result = _browser_search_internal(optimized_query)
-            return f"Decision: Comprehensive Search\n\nWeb Search Results:\n{web_result}\n\nPlaces Search Results:\n{places_result}\n\nBrowser Search Results:\n{browser_result}"
+            # Serper first: the browser is an order of magnitude slower, so it only runs
+            # when the query needs live data that the search results don't already carry
+            web_result, places_result = _run_searches(
+                optimized_query, _web_search_internal, _places_search_internal, started=prefetched
+            )
+            if not _NEEDS_BROWSER_RE.search(optimized_query):
+                browser_result = "Skipped (no pricing, booking or real-time details requested)"
+            elif _PRICING_RE.search(web_result) or _PRICING_RE.search(places_result):
+                browser_result = "Skipped (search results already include pricing)"
+            else:
+                browser_result = _browser_search_internal(optimized_query)
+            return _comprehensive_report(web_result, places_result, browser_result)
         else:
             # Default comprehensive search
-            web_result = _web_search_internal(optimized_query)
-            places_result = _places_search_internal(optimized_query)
+            web_result, places_result = _run_searches(
+                optimized_query, _web_search_internal, _places_search_internal, started=prefetched
+            )
             return f"Decision unclear: {decision}. Using comprehensive search as default.\n\nWeb Results:\n{web_result}\n\nPlaces Results:\n{places_result}"
             
     except Exception as e:
         return f"Error in intelligent search: {str(e)}"
+    finally:
+        # Drop prefetches the decision didn't need if they haven't started yet
+        for future in prefetched.values():
+            future.cancel()
 
 def research_query(query: str) -> str:
     """Research the given query using multiple advanced tools: Google Serper API, Places search, and Hyperbrowser automation.
      First optimizes the query, then intelligently selects and executes the most appropriate search tools for comprehensive results."""
     
-    # Step 1: Get optimized query (working pattern)
-    optimized_query = query
-    openai_key = os.getenv("OPENAI_API_KEY")
-    if openai_key and len(openai_key.strip()) > 0:
-        system_prompt = """You are a master expert in crafting optimal Google search queries for the Serper API. 
-        Return ONLY the optimized search query - no explanations or additional text."""
-        
-        optimization_prompt = f'Original query: "{query}"\nOptimized query:'
-        
-        response = llm.invoke([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": optimization_prompt}
-        ])
-        
-        optimized_query = response.content.strip()
-    
-    # Step 2: Web search (working pattern from _web_search_internal)
-    serper_key = os.getenv("SERPER_API_KEY")
-    if serper_key:
-        os.environ["SERPER_API_KEY"] = serper_key
+    # Step 0: A similar question answered recently skips the whole pipeline, and a
+    # loosely similar one at least lends its optimized query
+    use_semantic = True
+    optimized_query = None
+    try:
+        cached, similarity = _RESEARCH_SEMANTIC_CACHE.nearest(query)
+        if similarity >= _RESEARCH_SEMANTIC_CACHE.threshold:
+            return cached["result"]
+        if (similarity >= _REUSE_OPTIMIZED_THRESHOLD and _needs_optimization(query)
+                and _reuses_cleanly(query, cached["optimized_query"])):
+            optimized_query = cached["optimized_query"]
+    except (openai.OpenAIError, ValueError):
+        use_semantic = False  # Embedding failed; run the pipeline uncached
     
-    search = GoogleSerperAPIWrapper()
-    web_result = search.run(optimized_query)
+    # Step 1: Get optimized query (working pattern)
+    if optimized_query is None:
+        optimized_query = _optimize_or_original(query)
     
-    # Step 3: Places search (working pattern)
-    places_result = call_serper_api("places", optimized_query)
+    # Step 2: Web and places searches are independent, so run them concurrently
+    web_result, places_result = _run_searches(
+        optimized_query, _web_search_internal, _places_search_internal
+    )
     
-    return f"🔍 Research Results for: {optimized_query}\n\n📰 Web Search Results:\n{web_result}\n\n📍 Places Search Results:\n{places_result}"
+    result = f"🔍 Research Results for: {optimized_query}\n\n📰 Web Search Results:\n{web_result}\n\n📍 Places Search Results:\n{places_result}"
+    if use_semantic and not _is_search_error(web_result) and not _is_search_error(places_result):
+        _RESEARCH_SEMANTIC_CACHE.set(query, {"optimized_query": optimized_query, "result": result})
+    return result
+
 
 
 
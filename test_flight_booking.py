@@ -6,6 +6,7 @@ Demonstrates airport search and flight search capabilities
 
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -54,15 +55,21 @@ def test_airport_search():
     
     test_cities = ["Naples", "New York", "Paris"]
     
-    for city in test_cities:
-        print(f"\n🔍 Searching for airports in: {city}")
-        print("-" * 60)
+    def lookup(city):
         try:
-            results = amadeus.get_airport_info(city)
-            formatted = format_airport_results(results)
-            print(formatted)
+            return format_airport_results(amadeus.get_airport_info(city))
         except Exception as e:
-            print(f"❌ Error: {str(e)}")
+            return f"❌ Error: {str(e)}"
+    
+    # Lookups are independent network calls: run them together (capped to stay
+    # within Amadeus rate limits), then print in the original order
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(executor.map(lookup, test_cities))
+    
+    for city, output in zip(test_cities, outputs):
+        print(f"\n🔍 Searching for airports in: {city}")
+        print("-" * 60)
+        print(output)
 
 def test_flight_search():
     """Test flight search functionality"""